@@ -12,21 +12,77 @@ minimum.
 """
 import os
 import re
+import math
+import json
+import time
+import logging
+import logging.handlers
+import itertools
 import urllib.parse
 from datetime import datetime
 from datetime import date, timedelta
 from dateutil.relativedelta import relativedelta
+import flask
 import dash
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 import dash_html_components as html
 import luts
-from gui import layout, path_prefix
+from gui import layout, path_prefix, current_year, manual_match_years
 
 # URL base to API glue.
 EAPI_API_URL = os.getenv("EAPI_API_URL")
 if EAPI_API_URL is None:
     raise RuntimeError("EAPI_API_URL environment variable not set.")
 
+# Opt-in traffic recorder, see replay.py.  Only parameter sets,
+# callback names and a random per-page session ID (see gui.layout)
+# are written -- no IPs, headers or cookies.
+TRAFFIC_LOG = os.getenv("TRAFFIC_LOG")
+traffic = logging.getLogger("traffic")
+traffic.propagate = False
+traffic.setLevel(logging.INFO)
+traffic_pid = None
+traffic_failed = False
+
+
+def record(callback, session, params):
+    """
+    Append one callback event to the traffic log, if enabled.
+    Recording is best-effort: if the log can't be written, warn
+    once and stop recording rather than break the form.
+    """
+    global traffic_pid, traffic_failed  # pylint: disable=W0603
+    if not TRAFFIC_LOG or traffic_failed:
+        return
+
+    try:
+        # Rotating one file from several worker processes loses lines,
+        # so each process writes its own.  Opened on first use so this
+        # holds even when workers are forked after the app is imported.
+        if traffic_pid != os.getpid():
+            for handler in list(traffic.handlers):
+                traffic.removeHandler(handler)
+            handler = logging.handlers.RotatingFileHandler(
+                "{}.{}".format(TRAFFIC_LOG, os.getpid()),
+                maxBytes=luts.traffic_log_bytes,
+                backupCount=luts.traffic_log_backups,
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            traffic.addHandler(handler)
+            traffic_pid = os.getpid()
+
+        traffic.info(
+            json.dumps(
+                dict(time=time.time(), session=session, callback=callback, params=params)
+            )
+        )
+    except Exception:  # pylint: disable=W0703
+        traffic_failed = True
+        logging.getLogger(__name__).warning(
+            "Traffic recording to %s disabled", TRAFFIC_LOG, exc_info=True
+        )
+
+
 app = dash.Dash(__name__, requests_pathname_prefix=path_prefix)
 
 # AWS Elastic Beanstalk looks for application by default,
@@ -102,23 +158,11 @@ def datetime_from_input(date):
     return datetime.strptime(date, "%Y-%m-%d")
 
 
-@app.callback(
-    [
-        Output("analog-daterange-validation", "children"),
-        Output("forecast-daterange-validation", "children"),
-        Output("submit-validation", "children"),
-        Output("api-button", "disabled"),
-    ],
-    [
-        Input("analog-start-date", "value"),
-        Input("analog-end-date", "value"),
-        Input("forecast-start-date", "value"),
-        Input("forecast-end-date", "value"),
-    ],
-)
-def validate_analog_dates(analog_start, analog_end, forecast_start, forecast_end):
+def check_daterange(analog_start, analog_end, forecast_start, forecast_end):
     """
-    Test the analog date spans.  If invalid, let the user know.
+    Test the analog and forecast date spans.  Returns None if
+    they're valid, otherwise a tuple of which span is wrong
+    ("analog" or "forecast") and a message for the user.
 
     Rules to test for Analogs:
         1. start date must not be after end date
@@ -130,79 +174,132 @@ def validate_analog_dates(analog_start, analog_end, forecast_start, forecast_end
         5. start date must not be after end date
         6. end month must be <= 12 months after start date
     """
-    analog_start = datetime_from_input(analog_start)
-    analog_end = datetime_from_input(analog_end)
-    forecast_start = datetime_from_input(forecast_start)
-    forecast_end = datetime_from_input(forecast_end)
     default_start_date, default_end_date = luts.get_default_analog_daterange()
-    general_error = html.Span(
-        "Please fix the invalid configurations elsewhere on this page before running this forecast."
-    )
 
     # Case 3
     if analog_end > default_end_date:
         return (
-            html.Span(
-                "⚠️ Data aren't available after {}.  Please change the start date to be no later than that.".format(
-                    default_start_date.strftime("%B, %Y")
-                )
+            "analog",
+            "⚠️ Data aren't available after {}.  Please change the start date to be no later than that.".format(
+                default_start_date.strftime("%B, %Y")
             ),
-            None,
-            general_error,
-            "disabled",
         )
 
     # Case 1
     if analog_start > analog_end:
         return (
-            html.Span(
-                "⚠️ The start date must come before, or be the same as, the end date."
-            ),
-            None,
-            general_error,
-            "disabled",
+            "analog",
+            "⚠️ The start date must come before, or be the same as, the end date.",
         )
 
     # Case 2
     if analog_start < (analog_end - relativedelta(months=12)):
-        return (
-            html.Span("⚠️ Analog search range can only be up to 12 months total."),
-            None,
-            general_error,
-            "disabled",
-        )
+        return "analog", "⚠️ Analog search range can only be up to 12 months total."
 
     # Case 4
     if analog_end >= forecast_start:
         return (
-            html.Span("⚠️ Analog search range must end before the start of the forecast date range."),
-            None,
-            general_error,
-            "disabled",
+            "analog",
+            "⚠️ Analog search range must end before the start of the forecast date range.",
         )
 
     # Case 5
     if forecast_start > forecast_end:
         return (
-            None,
-            html.Span(
-                "⚠️ The start date must come before, or be the same as, the end date."
-            ),
-            general_error,
-            "disabled",
+            "forecast",
+            "⚠️ The start date must come before, or be the same as, the end date.",
         )
 
     # Case 6
     if forecast_start < (forecast_end - relativedelta(months=12)):
+        return "forecast", "⚠️ Forecast range can only be up to 12 months total."
+
+    return None
+
+
+@app.callback(
+    [
+        Output("analog-daterange-validation", "children"),
+        Output("forecast-daterange-validation", "children"),
+        Output("submit-validation", "children"),
+        Output("api-button", "disabled"),
+        Output("launch-timer", "disabled"),
+    ],
+    [
+        Input("analog-start-date", "value"),
+        Input("analog-end-date", "value"),
+        Input("forecast-start-date", "value"),
+        Input("forecast-end-date", "value"),
+        Input("api-button", "n_clicks"),
+        Input("api-button", "formAction"),
+        Input("launch-timer", "n_intervals"),
+    ],
+    [State("session-id", "data")],
+)
+def update_launch_controls(
+    analog_start,
+    analog_end,
+    forecast_start,
+    forecast_end,
+    n_clicks,
+    api_url,
+    ticks,
+    session,
+):
+    """
+    Enable or disable the forecast button.
+
+    It's disabled while the date spans are invalid (see
+    check_daterange), with messages telling the user why.
+
+    It's also disabled right after a forecast is launched, so
+    clicking again while waiting doesn't start a duplicate run.
+    It comes back when something in the form changes (which
+    changes the button's formAction), or when the launch timer
+    fires after three minutes in case the results window failed
+    or was closed.  Reloading the page resets this.
+    """
+    error = check_daterange(
+        datetime_from_input(analog_start),
+        datetime_from_input(analog_end),
+        datetime_from_input(forecast_start),
+        datetime_from_input(forecast_end),
+    )
+    if error:
+        span, message = error
+        general_error = html.Span(
+            "Please fix the invalid configurations elsewhere on this page before running this forecast."
+        )
         return (
-            None,
-            html.Span("⚠️ Forecast range can only be up to 12 months total."),
+            html.Span(message) if span == "analog" else None,
+            html.Span(message) if span == "forecast" else None,
             general_error,
             "disabled",
+            True,
+        )
+
+    # Just launched, so don't allow the same forecast to be run again.
+    ctx = dash.callback_context
+    if "api-button.n_clicks" in [trigger["prop_id"] for trigger in ctx.triggered]:
+        query = urllib.parse.urlsplit(api_url).query
+        record(
+            "launch",
+            session,
+            dict(urllib.parse.parse_qsl(query, keep_blank_values=True)),
+        )
+        return (
+            None,
+            None,
+            html.P(
+                "Your forecast is running in a new window.  This button will be available again in three minutes, or change any of the settings above to run another forecast now.",
+                className="content is-size-6",
+            ),
+            "disabled",
+            False,
         )
 
     # 🏁 Valid!
-    return None, None, None, False
+    return None, None, None, False, True
 
 
 # Not exposed in current version of app.
@@ -220,112 +317,176 @@ def toggle_manual_match_form(method):
     return "hidden"
 
 
-# The next piece is slightly painful but at least it's explicit.
+def normalize_forecast_params(params):
+    """
+    Returns a copy of the API parameters in a canonical form:
+    manual weights are reset to their defaults when auto-weighting,
+    and override years are reset to their defaults when auto-matching.
+    """
+    params = dict(params)
+    if params["auto_weight"] == 1:
+        for config in luts.manual_weights.values():
+            params["manual_weight_" + str(config["idx"])] = config["default"]
+    if params["manual_match"] == 0:
+        for field_id, year in manual_match_years.items():
+            params[field_id.replace("-", "_")] = year
+    return params
+
+
 @app.callback(
     Output("api-button", "formAction"),
-    [
-        Input("analog_bbox_n", "value"),
-        Input("analog_bbox_w", "value"),
-        Input("analog_bbox_e", "value"),
-        Input("analog_bbox_s", "value"),
-        Input("forecast_bbox_n", "value"),
-        Input("forecast_bbox_w", "value"),
-        Input("forecast_bbox_e", "value"),
-        Input("forecast_bbox_s", "value"),
-        Input("analog-start-date", "value"),
-        Input("analog-end-date", "value"),
-        Input("forecast-start-date", "value"),
-        Input("forecast-end-date", "value"),
-        Input("num_analogs", "value"),
-        Input("forecast-theme", "value"),
-        Input("auto-weight", "value"),
-        Input("manual_weight_1", "value"),
-        Input("manual_weight_2", "value"),
-        Input("manual_weight_3", "value"),
-        Input("manual_weight_4", "value"),
-        Input("manual_weight_5", "value"),
-        Input("correlation", "value"),
-        Input("manual-match", "value"),
-        Input("override-year-1", "value"),
-        Input("override-year-2", "value"),
-        Input("override-year-3", "value"),
-        Input("override-year-4", "value"),
-        Input("override-year-5", "value"),
-        Input("detrend-data", "value"),
-        Input("pressure_height", "value"),
-        Input("pressure_temp", "value"),
-    ],
+    [Input(field_id, "value") for field_id in luts.forecast_params.values()],
+    [State("session-id", "data")],
 )
-def update_api_url(
-    analog_bbox_n,
-    analog_bbox_w,
-    analog_bbox_e,
-    analog_bbox_s,
-    forecast_bbox_n,
-    forecast_bbox_w,
-    forecast_bbox_e,
-    forecast_bbox_s,
-    analog_start_date,
-    analog_end_date,
-    forecast_start_date,
-    forecast_end_date,
-    num_analogs,
-    forecast_theme,
-    auto_weight,
-    manual_weight_1,
-    manual_weight_2,
-    manual_weight_3,
-    manual_weight_4,
-    manual_weight_5,
-    correlation,
-    manual_match,
-    override_year_1,
-    override_year_2,
-    override_year_3,
-    override_year_4,
-    override_year_5,
-    detrend_data,
-    pressure_height,
-    pressure_temp,
-):
+def update_api_url(*values):
     """ Build API URL string from GUI """
-    params = urllib.parse.urlencode(
-        dict(
-            analog_bbox_n=analog_bbox_n,
-            analog_bbox_w=analog_bbox_w,
-            analog_bbox_e=analog_bbox_e,
-            analog_bbox_s=analog_bbox_s,
-            forecast_bbox_n=forecast_bbox_n,
-            forecast_bbox_w=forecast_bbox_w,
-            forecast_bbox_e=forecast_bbox_e,
-            forecast_bbox_s=forecast_bbox_s,
-            analog_daterange_start=analog_start_date,
-            analog_daterange_end=analog_end_date,
-            forecast_daterange_start=forecast_start_date,
-            forecast_daterange_end=forecast_end_date,
-            num_analogs=num_analogs,
-            forecast_theme=forecast_theme,
-            auto_weight=auto_weight,
-            manual_weight_1=manual_weight_1,
-            manual_weight_2=manual_weight_2,
-            manual_weight_3=manual_weight_3,
-            manual_weight_4=manual_weight_4,
-            manual_weight_5=manual_weight_5,
-            correlation=correlation,
-            manual_match=manual_match,
-            override_year_1=override_year_1,
-            override_year_2=override_year_2,
-            override_year_3=override_year_3,
-            override_year_4=override_year_4,
-            override_year_5=override_year_5,
-            detrend_data=detrend_data,
-            pressure_height=pressure_height,
-            pressure_temp=pressure_temp,
-        )
-    )
+    *values, session = values
+    params = normalize_forecast_params(zip(luts.forecast_params, values))
+    record("update_api_url", session, params)
+    params = urllib.parse.urlencode(params)
     url = EAPI_API_URL + "/forecast?" + params
     return url
 
 
+def parse_number(value):
+    """ Parse an int or a finite float, as the GUI's number inputs send. """
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        if not math.isfinite(number):
+            raise ValueError(value)
+        return number
+
+
+def parse_sweep_value(name, value):
+    """
+    Query strings are text; get back to what the GUI sends,
+    raising ValueError for anything the GUI wouldn't allow.
+    """
+    if name.startswith(("analog_bbox_", "forecast_bbox_", "manual_weight_")):
+        return parse_number(value)
+    if "_daterange_" in name:
+        return datetime_from_input(value).strftime("%Y-%m-%d")
+    if name.startswith("override_year_"):
+        if value == "None":
+            return None
+        year = int(value)
+        if not 1949 <= year <= current_year:
+            raise ValueError(value)
+        return year
+
+    allowed = {
+        "num_analogs": range(1, 6),
+        "forecast_theme": luts.forecast_themes.values(),
+        "correlation": luts.correlations.values(),
+        "pressure_height": luts.pressure_levels.keys(),
+        "pressure_temp": luts.pressure_levels.keys(),
+    }.get(name, (0, 1))
+    if int(value) not in allowed:
+        raise ValueError(value)
+    return int(value)
+
+
+@application.route("/sweep")
+def sweep():
+    """
+    Expand a base configuration into a set of forecast runs.
+
+    Takes the same query string as the /forecast URL built by
+    update_api_url.  Any parameter may instead carry a
+    comma-separated list of values (for example,
+    forecast_theme=1,3,5&detrend_data=0,1), which makes it an
+    axis of the sweep.  Every combination of the axes is
+    normalized (see normalize_forecast_params) and duplicates
+    are dropped.  Values, including the date ranges, are checked
+    against the same rules as the GUI; anything it would block
+    is rejected.  Each run in the result is launched with a POST
+    to its url, like the form does.
+    """
+    missing = [
+        name for name in luts.forecast_params if name not in flask.request.args
+    ]
+    if missing:
+        return flask.jsonify(error="Missing parameters: " + ", ".join(missing)), 400
+
+    names = list(luts.forecast_params)
+    axes = []
+    for name in names:
+        values = flask.request.args[name].split(",")
+        try:
+            values = [parse_sweep_value(name, value) for value in values]
+        except ValueError:
+            return (
+                flask.jsonify(
+                    error="Invalid value for {}: {}".format(
+                        name, flask.request.args[name]
+                    )
+                ),
+                400,
+            )
+        axes.append(list(dict.fromkeys(values)))
+
+    # Check the size before expanding, so a long list of
+    # values can't tie up the worker.
+    combinations = 1
+    for axis in axes:
+        combinations *= len(axis)
+    if combinations > luts.max_sweep_runs:
+        return (
+            flask.jsonify(
+                error="Sweeps are limited to {} runs.".format(luts.max_sweep_runs)
+            ),
+            400,
+        )
+
+    runs = []
+    seen = set()
+    for values in itertools.product(*axes):
+        params = normalize_forecast_params(zip(names, values))
+        key = tuple(params.items())
+        if key in seen:
+            continue
+        seen.add(key)
+        error = check_daterange(
+            *[
+                datetime_from_input(params[name])
+                for name in (
+                    "analog_daterange_start",
+                    "analog_daterange_end",
+                    "forecast_daterange_start",
+                    "forecast_daterange_end",
+                )
+            ]
+        )
+        if error:
+            span, message = error
+            return (
+                flask.jsonify(
+                    error="Invalid {} date range ({}): {}".format(
+                        span,
+                        " to ".join(
+                            params[name]
+                            for name in names
+                            if name.startswith(span + "_daterange_")
+                        ),
+                        message,
+                    )
+                ),
+                400,
+            )
+        # The forecast is launched the same way the GUI's form
+        # does it: a POST to this URL.
+        runs.append(
+            dict(
+                params=params,
+                method="POST",
+                url=EAPI_API_URL + "/forecast?" + urllib.parse.urlencode(params),
+            )
+        )
+
+    return flask.jsonify(runs=runs)
+
+
 if __name__ == "__main__":
     application.run(debug=os.getenv("FLASK_DEBUG", default=False), port=8080)
@@ -4,6 +4,7 @@ GUI for app
 """
 
 import os
+import uuid
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import dash_core_components as dcc
@@ -380,10 +381,13 @@ right_column = [
     ddsih.DangerouslySetInnerHTML("""
 <div class="launch-notes content is-size-6">
     <p>Clicking the button below will open a new window that will run the analog forecast.</p>
-    <p>⚠️ <strong>It may take up to three minutes for the results to be available.</strong>  Leave the window open until the processes completes.</p>
+    <p>⚠️ <strong>It may take up to three minutes for the results to be available.</strong>  Leave that window open until the process completes; there's no progress shown here.  The button below is disabled for three minutes after you click it, so the same forecast isn't started twice.</p>
 </div>
     """),
     html.Div(id="submit-validation", className="validation", children=[]),
+    # Turns the forecast button back on after a launch, see
+    # update_launch_controls.  Three minutes, same as the note above.
+    dcc.Interval(id="launch-timer", interval=3 * 60 * 1000, disabled=True),
     html.Button(
         "Run analog forecast",
         id="api-button",
@@ -475,4 +479,18 @@ footer = html.Footer(
 )
 
 
-layout = html.Div(children=[header, about, main_section, about_data, footer])
+def layout():
+    """
+    Built on each page load, so every page gets its own random
+    session ID for the traffic log (see record() in application.py).
+    """
+    return html.Div(
+        children=[
+            header,
+            about,
+            main_section,
+            about_data,
+            footer,
+            dcc.Store(id="session-id", data=uuid.uuid4().hex),
+        ]
+    )
@@ -103,6 +103,51 @@ manual_weights = {
     "SST": dict(default=0, idx=5),
 }
 
+# Parameters sent to the API's /forecast endpoint, and the
+# ID of the GUI control each one is read from, in the order
+# they're sent.  update_api_url and /sweep are built from this.
+forecast_params = {
+    "analog_bbox_n": "analog_bbox_n",
+    "analog_bbox_w": "analog_bbox_w",
+    "analog_bbox_e": "analog_bbox_e",
+    "analog_bbox_s": "analog_bbox_s",
+    "forecast_bbox_n": "forecast_bbox_n",
+    "forecast_bbox_w": "forecast_bbox_w",
+    "forecast_bbox_e": "forecast_bbox_e",
+    "forecast_bbox_s": "forecast_bbox_s",
+    "analog_daterange_start": "analog-start-date",
+    "analog_daterange_end": "analog-end-date",
+    "forecast_daterange_start": "forecast-start-date",
+    "forecast_daterange_end": "forecast-end-date",
+    "num_analogs": "num_analogs",
+    "forecast_theme": "forecast-theme",
+    "auto_weight": "auto-weight",
+    "manual_weight_1": "manual_weight_1",
+    "manual_weight_2": "manual_weight_2",
+    "manual_weight_3": "manual_weight_3",
+    "manual_weight_4": "manual_weight_4",
+    "manual_weight_5": "manual_weight_5",
+    "correlation": "correlation",
+    "manual_match": "manual-match",
+    "override_year_1": "override-year-1",
+    "override_year_2": "override-year-2",
+    "override_year_3": "override-year-3",
+    "override_year_4": "override-year-4",
+    "override_year_5": "override-year-5",
+    "detrend_data": "detrend-data",
+    "pressure_height": "pressure_height",
+    "pressure_temp": "pressure_temp",
+}
+
+# Upper bound on the number of runs a single sweep can expand to.
+# Every theme x every number of analogs x both detrend settings is 60.
+max_sweep_runs = 60
+
+# Size of each traffic log file, and how many rotated
+# files to keep, when TRAFFIC_LOG is set.
+traffic_log_bytes = 10 * 1024 * 1024
+traffic_log_backups = 5
+
 # These correlate to the custom ncar library file BB_Utils,
 # in the function getlev()
 pressure_levels = {1: "925mb", 5: "500mb", 9: "200mb"}
@@ -0,0 +1,162 @@
+# pylint: disable=C0103,C0301
+"""
+Replay a traffic log recorded with TRAFFIC_LOG against an API instance.
+
+Only "launch" events (someone clicked "Run analog forecast") turn into
+requests; the "update_api_url" events are kept in the log, and grouped
+by their session ID they show how each page arrived at a configuration.  Requests go out on the recorded
+schedule, sped up by --speed (0 = as fast as --workers allows).
+
+    python replay.py traffic.log http://localhost:3000 --speed 10 --cache-size 10 --cache-size 100
+
+Reports request outcomes, latency percentiles (from each request's
+scheduled send time, with timeouts and failures included), the number
+of page sessions, and the hit rate an LRU cache of each --cache-size
+would have had on this traffic.
+"""
+
+import sys
+import glob
+import json
+import math
+import time
+import socket
+import argparse
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def read_launches(log):
+    """ Launch events from every worker's log and rotated files, oldest first. """
+    events = []
+    for filename in glob.glob(log + ".[0-9]*"):
+        with open(filename) as f:
+            for line in f:
+                # Skip anything cut off, e.g. by a worker being killed mid-write.
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event.get("callback") == "launch":
+                    events.append(event)
+    return sorted(events, key=lambda event: event["time"])
+
+
+def request_key(params):
+    """ Identical parameter sets are the same backend run. """
+    return urllib.parse.urlencode(sorted(params.items()))
+
+
+def lru_hit_rate(keys, size):
+    """ Fraction of requests an LRU cache with room for `size` results would serve. """
+    cache = OrderedDict()
+    hits = 0
+    for key in keys:
+        if key in cache:
+            hits += 1
+            cache.move_to_end(key)
+        else:
+            cache[key] = True
+            if len(cache) > size:
+                cache.popitem(last=False)
+    return hits / len(keys)
+
+
+def percentile(values, pct):
+    """ Nearest-rank percentile of a sorted list. """
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def fetch(url, timeout, scheduled):
+    """
+    Run one forecast request.  Returns (seconds, outcome), where
+    seconds are counted from when the request was scheduled to go
+    out -- so time spent waiting for a free worker is included --
+    and outcome is None, "timeout", or an error message.
+    """
+    # Same as the form: a POST to the URL with the parameters in the
+    # query string and an empty form body.
+    request = urllib.request.Request(
+        url,
+        data=b"",
+        method="POST",
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+        outcome = None
+    except socket.timeout:
+        outcome = "timeout"
+    except urllib.error.URLError as exc:
+        outcome = "timeout" if isinstance(exc.reason, socket.timeout) else str(exc)
+    except Exception as exc:  # pylint: disable=W0703
+        outcome = str(exc)
+    return time.monotonic() - scheduled, outcome
+
+
+def replay(events, api_url, speed, workers, timeout):
+    """ Send each launch on the recorded (scaled) schedule. """
+    start = time.monotonic()
+    first = events[0]["time"]
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for event in events:
+            scheduled = time.monotonic()
+            if speed:
+                scheduled = start + (event["time"] - first) / speed
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            url = api_url + "/forecast?" + urllib.parse.urlencode(event["params"])
+            futures.append(pool.submit(fetch, url, timeout, scheduled))
+    return [future.result() for future in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "log", help="TRAFFIC_LOG value; every worker's file and rotations are read"
+    )
+    parser.add_argument("api_url", help="API base URL, e.g. http://localhost:3000")
+    parser.add_argument(
+        "--speed", type=float, default=1, help="1 = real time, 10 = 10x, 0 = max"
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument(
+        "--cache-size", type=int, action="append", default=[], dest="cache_sizes"
+    )
+    args = parser.parse_args()
+
+    events = read_launches(args.log)
+    if not events:
+        sys.exit("No launches recorded in " + args.log)
+
+    keys = [request_key(event["params"]) for event in events]
+    sessions = {event.get("session") for event in events}
+    print("Launches: {} from {} page sessions".format(len(keys), len(sessions)))
+    print("Distinct configurations: {}".format(len(set(keys))))
+    for size in args.cache_sizes:
+        print("LRU cache of {}: {:.1%} hit rate".format(size, lru_hit_rate(keys, size)))
+
+    results = replay(events, args.api_url, args.speed, args.workers, args.timeout)
+    outcomes = [outcome for seconds, outcome in results]
+    print(
+        "Requests completed: {}, timed out: {}, failed: {}".format(
+            outcomes.count(None),
+            outcomes.count("timeout"),
+            len(outcomes) - outcomes.count(None) - outcomes.count("timeout"),
+        )
+    )
+    # Every request counts, timeouts and failures included, timed
+    # from its scheduled send time.
+    latencies = sorted(seconds for seconds, outcome in results)
+    for pct in (50, 90, 99):
+        print("p{}: {:.2f}s".format(pct, percentile(latencies, pct)))
+
+if __name__ == "__main__":
+    main()